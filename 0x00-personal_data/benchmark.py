@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+""" Benchmarks for the PII redaction helpers of filtered_logger
+"""
+import logging
+import os
+import re
+import sys
+import time
+import timeit
+from concurrent.futures import ThreadPoolExecutor
+from os import environ
+import encrypt_password
+from filtered_logger import (PII_FIELDS, RedactingFormatter, filter_datum,
+                             trie_pattern)
+
+
+def bench_formatter(number: int = 100000) -> None:
+    """ Compares string and structured RedactingFormatter modes """
+    user = {"name": "egg", "email": "eggmin@eggsample.com",
+            "phone": "555-0100", "ssn": "123-45-6789",
+            "password": "eggcellent", "ip": "60ed:c396:2ff:244:bbd0:9208"}
+    text = "".join(f"{k}={v};" for k, v in user.items())
+    cases = (
+        ("string", RedactingFormatter(list(PII_FIELDS)),
+         logging.LogRecord("user_data", logging.INFO, None, None,
+                           text, None, None)),
+        ("structured", RedactingFormatter(list(PII_FIELDS), True),
+         logging.LogRecord("user_data", logging.INFO, None, None,
+                           user, None, None)),
+    )
+    for mode, formatter, record in cases:
+        elapsed = timeit.timeit(lambda: formatter.format(record),
+                                number=number)
+        print(f"{mode:<12} {elapsed / number * 1e6:8.2f} us/record")
+
+
+def bench_config(number: int = 100000) -> None:
+    """ Compares per-record env lookups with the configuration snapshot """
+    formatter = RedactingFormatter(list(PII_FIELDS))
+    record = logging.LogRecord("user_data", logging.INFO, None, None,
+                               "name=bob;email=bob@dylan.com;ip=::1;",
+                               None, None)
+
+    def from_env() -> str:
+        return filter_datum(formatter.fields, environ.get("REDACTION", "***"),
+                            logging.Formatter.format(formatter, record),
+                            environ.get("SEPARATOR", ";"))
+
+    for mode, func in (("env", from_env),
+                       ("snapshot", lambda: formatter.format(record))):
+        elapsed = timeit.timeit(func, number=number)
+        print(f"{mode:<12} {elapsed / number * 1e6:8.2f} us/record")
+
+
+def bench_fields(number: int = 3) -> None:
+    """ Times redaction as the field list and the message grow """
+    print(f"{'fields':>6} {'bytes':>6} {'per-field':>10} "
+          f"{'alternation':>12} {'trie':>10}  (ms/message)")
+    for count in (5, 50, 200, 1000):
+        fields = tuple(f"field_{i}" for i in range(count))
+        alternation = re.compile("({})=.*?;".format("|".join(fields)))
+        trie = re.compile("({})=.*?;".format(trie_pattern(fields)))
+        for size in (100, 4096, 65536):
+            pairs = (f"{fields[i % count]}=v{i};" if i % 4 == 0 else
+                     f"other_{i}=v{i};" for i in range(size))
+            message = "".join(pairs)[:size]
+            timings = []
+            for func in (
+                    lambda: [re.sub(f"{k}=.*?;", f"{k}=***;", message)
+                             for k in fields],
+                    lambda: alternation.sub(r"\1=***;", message),
+                    lambda: trie.sub(r"\1=***;", message)):
+                elapsed = timeit.timeit(func, number=number)
+                timings.append(elapsed / number * 1e3)
+            print(f"{count:>6} {size:>6} {timings[0]:>10.3f} "
+                  f"{timings[1]:>12.3f} {timings[2]:>10.3f}")
+
+
+def bench_bcrypt(count: int = 32) -> None:
+    """ Measures hash_passwords throughput from 1 to cpu_count workers """
+    passwords = [f"password-{i}" for i in range(count)]
+    workers = 1
+    while True:
+        with ThreadPoolExecutor(workers) as executor:
+            start = time.perf_counter()
+            encrypt_password.hash_passwords(passwords, executor)
+            elapsed = time.perf_counter() - start
+        print(f"{workers:>3} workers {count / elapsed:8.1f} hashes/s")
+        if workers >= (os.cpu_count() or 1):
+            break
+        workers = min(workers * 2, os.cpu_count() or 1)
+
+
+BENCHMARKS = {
+    "formatter": bench_formatter,
+    "config": bench_config,
+    "fields": bench_fields,
+    "bcrypt": bench_bcrypt,
+}
+
+
+if __name__ == "__main__":
+    for name in sys.argv[1:] or BENCHMARKS:
+        print(f"== {name}")
+        BENCHMARKS[name]()
@@ -1,12 +1,27 @@
 #!/usr/bin/env python3
 """ Defines hash_password """
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from os import cpu_count, environ
+from typing import Iterable, List, Optional, Tuple
 import bcrypt
 
 
+MIN_ROUNDS = 4
+MAX_ROUNDS = 31
+ROUNDS = int(environ.get("BCRYPT_ROUNDS", 12))
+WORKERS = int(environ.get("BCRYPT_WORKERS", cpu_count() or 1))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
 def hash_password(password: str) -> bytes:
     """ Creates a hash password using bcrypt """
-    password = password.enode()
-    hashed = bcrypt.hashpw(password, bcrypt.gensalt())
+    password = password.encode()
+    hashed = bcrypt.hashpw(password, bcrypt.gensalt(ROUNDS))
     return hashed
 
 
@@ -14,3 +29,90 @@ def is_valid(hashed_password: bytes, password: str) -> bool:
     """ Validates a hashed password"""
     passwordE = password.encode()
     return bcrypt.checkpw(passwordE, hashed_password)
+
+
+def calibrate_rounds(target: float = 0.25, ceiling: int = MAX_ROUNDS) -> int:
+    """ Returns the highest work factor whose verification stays within
+    target seconds on this machine """
+    rounds = MIN_ROUNDS
+    hashed = bcrypt.hashpw(b"calibration", bcrypt.gensalt(rounds))
+    start = time.perf_counter()
+    bcrypt.checkpw(b"calibration", hashed)
+    elapsed = time.perf_counter() - start
+    while rounds < ceiling and elapsed * 2 <= target:
+        rounds += 1
+        elapsed *= 2
+    return rounds
+
+
+def hash_rounds(hashed_password: bytes) -> int:
+    """ Returns the work factor a bcrypt hash was created with """
+    return int(hashed_password.split(b"$")[2])
+
+
+def needs_rehash(hashed_password: bytes) -> bool:
+    """ Checks whether a hash was created with a lower work factor than
+    the current one; stronger hashes are kept so that lowering
+    BCRYPT_ROUNDS never downgrades them """
+    return hash_rounds(hashed_password) < ROUNDS
+
+
+def verify_and_upgrade(hashed_password: bytes,
+                       password: str) -> Tuple[bool, Optional[bytes]]:
+    """ Validates a password and returns a new hash to store when the old
+    one used a weaker work factor """
+    if not is_valid(hashed_password, password):
+        return False, None
+    if needs_rehash(hashed_password):
+        return True, hash_password(password)
+    return True, None
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """ Returns the shared pool of BCRYPT_WORKERS hashing threads """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(WORKERS,
+                                           thread_name_prefix="bcrypt")
+        return _executor
+
+
+def hash_passwords(passwords: Iterable[str],
+                   executor: ThreadPoolExecutor = None) -> List[bytes]:
+    """ Hashes many passwords in parallel, keeping their order """
+    executor = executor or get_executor()
+    return list(executor.map(hash_password, passwords))
+
+
+def verify_many(pairs: Iterable[Tuple[bytes, str]],
+                executor: ThreadPoolExecutor = None) -> List[bool]:
+    """ Validates many (hashed_password, password) pairs in parallel """
+    executor = executor or get_executor()
+    return list(executor.map(lambda pair: is_valid(*pair), pairs))
+
+
+async def hash_password_async(password: str) -> bytes:
+    """ Awaitable hash_password running on the shared pool """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), hash_password,
+                                      password)
+
+
+async def is_valid_async(hashed_password: bytes, password: str) -> bool:
+    """ Awaitable is_valid running on the shared pool """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), is_valid,
+                                      hashed_password, password)
+
+
+async def hash_passwords_async(passwords: Iterable[str]) -> List[bytes]:
+    """ Awaitable hash_passwords """
+    return list(await asyncio.gather(*map(hash_password_async, passwords)))
+
+
+async def verify_many_async(pairs: Iterable[Tuple[bytes, str]]
+                            ) -> List[bool]:
+    """ Awaitable verify_many """
+    return list(await asyncio.gather(*(is_valid_async(h, p)
+                                       for h, p in pairs)))
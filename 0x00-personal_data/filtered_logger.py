@@ -1,8 +1,22 @@
 #!/usr/bin/env python3
 
+import atexit
+import copy
 import logging
+import queue
 import re
-from typing import List
+import signal
+import sqlite3
+import sys
+import threading
+import traceback
+import weakref
+from logging.handlers import QueueHandler
+from functools import lru_cache
+from collections.abc import Mapping
+from contextlib import closing, contextmanager
+from typing import (Callable, Iterator, List, NamedTuple, Optional, Sequence,
+                    TextIO, Tuple)
 from os import environ
 import mysql.connector as mc
 
@@ -10,44 +24,267 @@ import mysql.connector as mc
 PII_FIELDS = ("name", "phone", "email", "ssn", "password")
 
 
+REDACTOR_CACHE_SIZE = 128
+
+
+def trie_pattern(keys: Tuple[str, ...]) -> str:
+    """ Returns a regex matching any of keys, factored into a prefix tree
+    so each position is tried in O(key length) whatever the key count """
+    trie = {}
+    for key in keys:
+        node = trie
+        for char in key:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def walk(node: dict) -> str:
+        branches = [re.escape(char) + walk(child)
+                    for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        if len(branches) == 1 and "" not in node:
+            return branches[0]
+        group = "(?:{})".format("|".join(branches))
+        return group + "?" if "" in node else group
+    return walk(trie)
+
+
+@lru_cache(maxsize=REDACTOR_CACHE_SIZE)
+def compile_redactor(fields: Tuple[str, ...], redaction: str,
+                     separator: str) -> Callable[[str], str]:
+    """ Returns a function redacting every field of a message in one pass """
+    if not fields:
+        return lambda message: message
+    if all(key and re.escape(key) == key for key in fields):
+        keys = trie_pattern(fields)
+    else:
+        keys = '|'.join(fields)
+    pattern = re.compile('({})=.*?{}'.format(keys, separator))
+    tail = f'={redaction}{separator}'
+
+    def redact(message: str) -> str:
+        """ Replaces the value of each matching field """
+        return pattern.sub(lambda m: m.group(1) + tail, message)
+    return redact
+
+
 def filter_datum(fields: List[str], redaction: str,
                  message: str, separator: str) -> str:
     """ Returns an obfuscated log message """
-    for key in fields:
-        message = re.sub(f'{key}=.*?{separator}',
-                         f'{key}={redaction}{separator}', message)
-    return message
+    return compile_redactor(tuple(fields), redaction, separator)(message)
+
+
+class FormatterConfig(NamedTuple):
+    """ Immutable snapshot of the env-driven RedactingFormatter settings """
+    log_format: str
+    redaction: str
+    separator: str
+    redact: Callable[[str], str]
+
+    @classmethod
+    def from_env(cls, fields: Tuple[str, ...]) -> 'FormatterConfig':
+        """ Reads LOG_FORMAT, REDACTION and SEPARATOR once """
+        redaction = environ.get("REDACTION", "***")
+        separator = environ.get("SEPARATOR", ";")
+        return cls(environ.get("LOG_FORMAT", "[HOLBERTON] %(name)s " +
+                               "%(levelname)s %(asctime)-15s: %(message)s"),
+                   redaction, separator,
+                   compile_redactor(fields, redaction, separator))
 
 
 class RedactingFormatter(logging.Formatter):
     """ Redacting Formatter class """
 
-    def __init__(self, fields: List[str]):
-        super().__init__(
-            environ.get("LOG_FORMAT", "[HOLBERTON] %(name)s " +
-                        "%(levelname)s %(asctime)-15s: %(message)s"))
+    _instances = weakref.WeakSet()
+
+    def __init__(self, fields: List[str], structured: bool = False):
         self.fields = fields
+        self.structured = structured
+        self._suffixes = tuple(fields)
+        self._pii_keys = {}
+        self.reload()
+        RedactingFormatter._instances.add(self)
+
+    @property
+    def config(self) -> FormatterConfig:
+        """ Current configuration snapshot """
+        return self._config
+
+    def reload(self) -> FormatterConfig:
+        """ Re-reads the configuration from the environment """
+        config = FormatterConfig.from_env(tuple(self.fields))
+        super().__init__(config.log_format)
+        self._config = config
+        return config
+
+    @classmethod
+    def reload_all(cls) -> None:
+        """ Reloads the configuration of every live formatter """
+        for formatter in list(cls._instances):
+            formatter.reload()
 
     def format(self, record: logging.LogRecord) -> str:
         """ Filters incoming records """
-        return filter_datum(self.fields, environ.get("REDACTION", "***"),
-                            super().format(record),
-                            environ.get("SEPARATOR", ";"))
+        config = self._config
+        if self.structured:
+            masked = self.mask_record(record, config)
+            if masked is not None:
+                if isinstance(record.msg, Mapping):
+                    return super().format(masked)
+                return config.redact(super().format(masked))
+        return config.redact(super().format(record))
 
+    def is_pii(self, key) -> bool:
+        """ Checks whether a key ends with a PII field, like the keys
+        filter_datum redacts """
+        pii = self._pii_keys.get(key)
+        if pii is None:
+            pii = str(key).endswith(self._suffixes)
+            if len(self._pii_keys) < REDACTOR_CACHE_SIZE:
+                self._pii_keys[key] = pii
+        return pii
 
-def get_logger() -> logging.Logger:
-    """ Returns a log object """
+    def mask_record(self, record: logging.LogRecord,
+                    config: FormatterConfig) -> Optional[logging.LogRecord]:
+        """ Returns a copy of a record whose dict message or mapping
+        arguments have the keys ending with a PII field masked, None if
+        the record carries no structured data; only a dict message is
+        fully redacted this way, as a format string may name its fields
+        differently from its keys """
+        msg, args = record.msg, record.args
+        redaction = config.redaction
+        is_pii = self.is_pii
+        if isinstance(msg, Mapping):
+            msg = "".join(f"{k}={redaction if is_pii(k) else v}"
+                          f"{config.separator}" for k, v in msg.items())
+        elif isinstance(args, Mapping):
+            args = {k: redaction if is_pii(k) else v
+                    for k, v in args.items()}
+        else:
+            return None
+        masked = logging.LogRecord.__new__(logging.LogRecord)
+        masked.__dict__.update(record.__dict__, msg=msg, args=args)
+        return masked
+
+
+def install_reload_handler(signum: int = signal.SIGHUP) -> None:
+    """ Reloads every RedactingFormatter when the process receives signum """
+    signal.signal(signum, lambda *_: RedactingFormatter.reload_all())
+
+
+class EnqueueHandler(QueueHandler):
+    """ Queue handler leaving formatting and redaction to the listener
+    thread """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """ Returns a copy of the record whose message no longer depends
+        on objects the caller may change: the rendered message, or a
+        shallow copy of a dict message or mapping arguments """
+        prepared = copy.copy(record)
+        if isinstance(record.msg, Mapping):
+            prepared.msg = dict(record.msg)
+        elif isinstance(record.args, Mapping):
+            prepared.args = dict(record.args)
+        else:
+            prepared.msg = record.getMessage()
+            prepared.args = None
+        return prepared
+
+
+class BatchStreamListener(threading.Thread):
+    """ Formats queued records and writes them to a stream in batches """
+
+    def __init__(self, records: queue.SimpleQueue,
+                 formatter: logging.Formatter, stream: TextIO = None,
+                 batch_size: int = 256):
+        super().__init__(name="user_data-listener", daemon=True)
+        self.records = records
+        self.formatter = formatter
+        self.stream = stream if stream is not None else sys.stderr
+        self.batch_size = batch_size
+
+    def run(self):
+        """ Writes every available record at once until stopped """
+        stop = False
+        while not stop:
+            batch = [self.records.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.records.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                stop = True
+                batch = batch[:batch.index(None)]
+            lines = []
+            for record in batch:
+                try:
+                    lines.append(self.formatter.format(record) + "\n")
+                except Exception:
+                    traceback.print_exc(file=sys.stderr)
+            if lines:
+                self.stream.write("".join(lines))
+                self.stream.flush()
+
+    def stop(self):
+        """ Drains the queue then waits for the thread to exit """
+        self.records.put(None)
+        self.join()
+
+
+_logger_lock = threading.Lock()
+
+
+def get_logger(queued: bool = False) -> logging.Logger:
+    """ Returns a log object, configured on first call only; when queued
+    the calling thread only enqueues records. Raises ValueError when the
+    logger is already configured in the other mode """
     log = logging.getLogger("user_data")
-    log.setLevel(logging.INFO)
-    log.propagate = False
-    stream_handler = logging.StreamHandler()
-    stream_handler.setFormatter(RedactingFormatter(list(PII_FIELDS)))
-    log.addHandler(stream_handler)
+    with _logger_lock:
+        if log.handlers:
+            if queued != any(isinstance(handler, EnqueueHandler)
+                             for handler in log.handlers):
+                raise ValueError("user_data logger is already configured "
+                                 "{}; call shutdown_logger() first".format(
+                                     "not queued" if queued else "queued"))
+            return log
+        log.setLevel(logging.INFO)
+        log.propagate = False
+        formatter = RedactingFormatter(list(PII_FIELDS))
+        if queued:
+            records = queue.SimpleQueue()
+            handler = EnqueueHandler(records)
+            handler.listener = BatchStreamListener(records, formatter)
+            handler.listener.start()
+            atexit.register(shutdown_logger)
+        else:
+            handler = logging.StreamHandler()
+            handler.setFormatter(formatter)
+        log.addHandler(handler)
     return log
 
 
+def shutdown_logger() -> None:
+    """ Flushes pending records and detaches the user_data handlers """
+    log = logging.getLogger("user_data")
+    with _logger_lock:
+        for handler in list(log.handlers):
+            log.removeHandler(handler)
+            listener = getattr(handler, "listener", None)
+            if listener is not None and listener.is_alive():
+                listener.stop()
+            handler.close()
+
+
+EXPORT_BATCH_SIZE = 1000
+
+
 def get_db() -> mc.connection.MySQLConnection:
-    """ Returns a MySQL Connector """
+    """ Returns a MySQL Connector, or a sqlite3 connection when
+    PERSONAL_DATA_DB_SQLITE names a local database file """
+    sqlite_path = environ.get("PERSONAL_DATA_DB_SQLITE")
+    if sqlite_path:
+        return sqlite3.connect(sqlite_path, check_same_thread=False)
     uname = environ.get("PERSONAL_DATA_DB_USERNAME", "root")
     pwd = environ.get("PERSONAL_DATA_DB_PASSWORD", "")
     h = environ.get("PERSONAL_DATA_DB_HOST", "localhost")
@@ -55,24 +292,174 @@ def get_db() -> mc.connection.MySQLConnection:
     return mc.connect(user=uname, password=pwd, host=h, database=db)
 
 
+def is_alive(db) -> bool:
+    """ Checks that a connection can still serve queries """
+    try:
+        if hasattr(db, "is_connected"):
+            return db.is_connected()
+        with closing(db.cursor()) as cur_db:
+            cur_db.execute("SELECT 1;")
+        return True
+    except Exception:
+        return False
+
+
+class ConnectionPool:
+    """ Bounded pool of connections, health-checked on checkout """
+
+    def __init__(self, connect: Callable = get_db, size: int = 5,
+                 timeout: float = 30.0):
+        self.connect = connect
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    @contextmanager
+    def connection(self) -> Iterator:
+        """ Lends a live connection, returned to the pool on exit and
+        discarded if the block raised """
+        if not self._slots.acquire(timeout=self.timeout):
+            raise mc.PoolError("No connection available after "
+                               f"{self.timeout} seconds")
+        db = None
+        try:
+            db = self._checkout()
+            yield db
+        except BaseException:
+            if db is not None:
+                self._discard(db)
+            raise
+        else:
+            self._idle.put(db)
+        finally:
+            self._slots.release()
+
+    def _checkout(self):
+        """ Returns the most recent healthy idle connection or a new one """
+        while True:
+            try:
+                db = self._idle.get_nowait()
+            except queue.Empty:
+                return self.connect()
+            if is_alive(db):
+                return db
+            self._discard(db)
+
+    @staticmethod
+    def _discard(db) -> None:
+        """ Closes a connection, ignoring errors """
+        try:
+            db.close()
+        except Exception:
+            pass
+
+    def close(self) -> None:
+        """ Closes every idle connection """
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                return
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_db_pool() -> ConnectionPool:
+    """ Returns the shared pool sized by PERSONAL_DATA_DB_POOL_SIZE and
+    PERSONAL_DATA_DB_POOL_TIMEOUT """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(
+                get_db, int(environ.get("PERSONAL_DATA_DB_POOL_SIZE", 5)),
+                float(environ.get("PERSONAL_DATA_DB_POOL_TIMEOUT", 30)))
+        return _pool
+
+
+def format_row(row: Sequence, field_names: List[str]) -> str:
+    """ Serializes a users row as a name=value; message """
+    return "".join(f"{f}={str(li)}; " for li,
+                   f in zip(row, field_names)).strip()
+
+
+def pii_columns(field_names: List[str],
+                fields: List[str]) -> Tuple[int, ...]:
+    """ Returns the indexes of the columns filter_datum would redact """
+    fields = tuple(fields)
+    return tuple(i for i, f in enumerate(field_names) if f.endswith(fields))
+
+
+def mask_columns(row: Sequence, columns: Tuple[int, ...], redaction: str,
+                 separator: str) -> Optional[List[str]]:
+    """ Returns the row values as strings with the given columns redacted,
+    None when a value holds '=' or a redacted one holds the separator and
+    the row needs filter_datum """
+    values = [str(li) for li in row]
+    for value in values:
+        if "=" in value:
+            return None
+    for i in columns:
+        if separator in values[i]:
+            return None
+        values[i] = redaction
+    return values
+
+
+def export_users(db, stream: TextIO = None, batch_size: int = None,
+                 by_column: bool = True) -> int:
+    """ Streams the users table to stream in fetchmany batches, writing
+    each redacted batch at once, and returns the number of rows; with
+    by_column, PII columns are masked by index instead of by regex """
+    if batch_size is None:
+        batch_size = int(environ.get("PERSONAL_DATA_EXPORT_BATCH_SIZE",
+                                     EXPORT_BATCH_SIZE))
+    if stream is None:
+        stream = sys.stderr
+    formatter = RedactingFormatter(list(PII_FIELDS))
+    config = formatter.config
+    columns = None
+
+    def format_line(row: Sequence) -> str:
+        values = None
+        if columns is not None:
+            values = mask_columns(row, columns, config.redaction, ";")
+        record = logging.LogRecord(
+            "user_data", logging.INFO, None, None,
+            format_row(row if values is None else values, field_names),
+            None, None)
+        if values is None:
+            return formatter.format(record) + "\n"
+        return logging.Formatter.format(formatter, record) + "\n"
+
+    count = 0
+    with closing(db.cursor()) as cur_db:
+        cur_db.execute("SELECT * FROM users;")
+        field_names = [i[0] for i in cur_db.description]
+        if by_column and config.separator == ";":
+            columns = pii_columns(field_names, formatter.fields)
+        rows = cur_db.fetchmany(batch_size)
+        while rows:
+            stream.write("".join(format_line(r) for r in rows))
+            count += len(rows)
+            rows = cur_db.fetchmany(batch_size)
+    stream.flush()
+    return count
+
+
 def main():
     """ Obtains a database connection using get_db and retrieves all rows
     in the users table then display each row under a filtered format """
+    pool = get_db_pool()
     try:
-        db = get_db()
-        with db.cursor() as cur_db:
-            cur_db.execute("SELECT * FROM users;")
-            field_names = [i[0] for i in cur_db.description]
-            log = get_logger()
-            for r in cur_db:
-                str_r = "".join(f"{f}={str(li)}; " for li,
-                                f in zip(r, field_names))
-                log.info(str_r.strip())
-    except mc.Error as e:
+        with pool.connection() as db:
+            export_users(db)
+    except (mc.Error, sqlite3.Error) as e:
         print(f"Error connecting to the database: {e}")
     finally:
-        if db:
-            db.close()
+        pool.close()
 
 
 if __name__ == "__main__":
@@ -14,6 +14,10 @@ app.config['JSONIFY_PRETTYPRINT_REGULAR'] = True
 app.register_blueprint(app_views)
 CORS(app, resources={r"/api/v1/*": {"origins": "*"}})
 auth = None
+EXCLUDED_PATHS = ['/api/v1/status/',
+                  '/api/v1/unauthorized/',
+                  '/api/v1/forbidden/',
+                  '/api/v1/auth_session/login/']
 AUTH_TYPE = getenv("AUTH_TYPE")
 
 if AUTH_TYPE == "auth":
@@ -60,11 +64,7 @@ def before_request() -> str:
     """
     if auth is None:
         return
-    excluded_paths = ['/api/v1/status/',
-                      '/api/v1/unauthorized/',
-                      '/api/v1/forbidden/',
-                      '/api/v1/auth_session/login/']
-    if not auth.require_auth(request.path, excluded_paths):
+    if not auth.require_auth(request.path, EXCLUDED_PATHS):
         return
     if auth.authorization_header(request) is None \
             and auth.session_cookie(request) is None:
@@ -7,8 +7,50 @@ from typing import List, TypeVar
 import os
 
 
+class PathMatcher:
+    """excluded paths compiled to an exact set and a wildcard prefix trie"""
+
+    def __init__(self, excluded_paths: List[str]):
+        '''compiles the excluded paths'''
+        self.exact = set()
+        self.trie = {}
+        for path in excluded_paths:
+            if path.endswith('/'):
+                path = path[:-1]
+            if path.endswith('*'):
+                node = self.trie
+                for char in path[:-1]:
+                    node = node.setdefault(char, {})
+                node[''] = True
+            else:
+                self.exact.add(path)
+                self.exact.add(path + '/')
+
+    def match(self, path: str) -> bool:
+        '''returns True if path is excluded'''
+        if path in self.exact:
+            return True
+        node = self.trie
+        for char in path:
+            if '' in node:
+                return True
+            node = node.get(char)
+            if node is None:
+                return False
+        return '' in node
+
+
 class Auth:
     """class to manage the API authentication"""
+    _excluded_paths = None
+    _path_matcher = None
+
+    def path_matcher(self, excluded_paths: List[str]) -> PathMatcher:
+        '''returns the matcher of excluded_paths, compiled once'''
+        if excluded_paths != self._excluded_paths:
+            self._path_matcher = PathMatcher(excluded_paths)
+            self._excluded_paths = list(excluded_paths)
+        return self._path_matcher
 
     def require_auth(self, path: str, excluded_paths: List[str]) -> bool:
         '''requires auth returns False - path'''
@@ -18,21 +60,7 @@ class Auth:
         if excluded_paths is None or not excluded_paths:
             return True
 
-        if path[-1] == '/':
-            path = path[:-1]
-
-        for p in range(len(excluded_paths)):
-            if excluded_paths[p][-1] == '/':
-                excluded_paths[p] = excluded_paths[p][:-1]
-            if excluded_paths[p][-1] == '*':
-                path_len = len(excluded_paths[p][:-1])
-                if path[:path_len - 1] in excluded_paths[p][:-1]:
-                    return False
-
-        if path in excluded_paths:
-            return False
-
-        return True
+        return not self.path_matcher(excluded_paths).match(path)
 
     def authorization_header(self, request=None) -> str:
         '''authorization header returns None - request'''
@@ -4,12 +4,83 @@
 
 from api.v1.auth.auth import Auth
 from base64 import b64decode
+from collections import OrderedDict
+import hashlib
 from models.user import User
+import os
+import threading
+import time
 from typing import TypeVar
 
 
+class CredentialCache:
+    """bounded LRU of verified Authorization headers to user IDs
+
+    Headers are keyed by their SHA-256 digest; an entry remembers the
+    email and password hash it was verified against so that changing
+    either or removing the user invalidates it on the next lookup.
+    """
+
+    def __init__(self, size: int = 1024, ttl: float = 300):
+        '''initialize a cache of size entries living ttl seconds'''
+        self.size = size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(authorization_header: str) -> bytes:
+        '''returns the digest of an Authorization header'''
+        return hashlib.sha256(authorization_header.encode()).digest()
+
+    def get(self, authorization_header: str) -> TypeVar('User'):
+        '''returns the cached User of a header, None on a miss'''
+        key = self.key(authorization_header)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            user_id, email, password, expiry = entry
+            if expiry < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+        user = User.get(user_id)
+        if user is None or user.email != email \
+                or user.password != password:
+            self.discard(authorization_header)
+            return None
+        return user
+
+    def put(self, authorization_header: str, user: TypeVar('User')) -> None:
+        '''remembers the User a header was verified for'''
+        if self.size <= 0:
+            return
+        key = self.key(authorization_header)
+        with self._lock:
+            self._entries[key] = (user.id, user.email, user.password,
+                                  time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def discard(self, authorization_header: str) -> None:
+        '''forgets a header'''
+        with self._lock:
+            self._entries.pop(self.key(authorization_header), None)
+
+    def clear(self) -> None:
+        '''forgets every header'''
+        with self._lock:
+            self._entries.clear()
+
+
 class BasicAuth(Auth):
     """BasicAuth class"""
+    credential_cache = CredentialCache(
+        int(os.getenv('BASIC_AUTH_CACHE_SIZE', 1024)),
+        float(os.getenv('BASIC_AUTH_CACHE_TTL', 300)))
+
     def extract_base64_authorization_header(self,
                                             authorization_header: str) -> str:
         '''returns the Base64 part of the Authorization header'''
@@ -60,12 +131,11 @@ class BasicAuth(Auth):
         if user_pwd is None or not isinstance(user_pwd, str):
             return None
         try:
-            get_users = User.search({'email': user_email})
+            for user in User.iter_search({'email': user_email}):
+                if user.is_valid_password(user_pwd):
+                    return user
         except Exception:
             return None
-        for user in get_users:
-            if user.is_valid_password(user_pwd):
-                return user
         return None
 
     def current_user(self, request=None) -> TypeVar('User'):
@@ -73,6 +143,9 @@ class BasicAuth(Auth):
         auth_header = self.authorization_header(request)
         if not auth_header:
             return None
+        user = self.credential_cache.get(auth_header)
+        if user is not None:
+            return user
         encoded = self.extract_base64_authorization_header(auth_header)
         if not encoded:
             return None
@@ -83,4 +156,6 @@ class BasicAuth(Auth):
         if not email or not pwd:
             return None
         user = self.user_object_from_credentials(email, pwd)
+        if user is not None:
+            self.credential_cache.put(auth_header, user)
         return user
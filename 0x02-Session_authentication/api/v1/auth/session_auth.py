@@ -3,6 +3,7 @@
 """
 
 from api.v1.auth.auth import Auth
+from api.v1.auth.session_store import open_store
 from models.user import User
 from uuid import uuid4
 
@@ -11,6 +12,12 @@ class SessionAuth(Auth):
     """SessionAuth class"""
     user_id_by_session_id = {}
 
+    def __init__(self):
+        '''uses the shared session store chosen by SESSION_STORE'''
+        store = open_store()
+        if store is not None:
+            self.user_id_by_session_id = store
+
     def create_session(self, user_id: str = None) -> str:
         '''creates a Session ID for a user_id'''
         if user_id is None:
@@ -19,7 +19,6 @@ class SessionDBAuth(SessionExpAuth):
         kwargs = {'user_id': user_id, 'session_id': session_id}
         user_session = UserSession(**kwargs)
         user_session.save()
-        UserSession.save_to_file()
 
         return session_id
 
@@ -28,16 +27,14 @@ class SessionDBAuth(SessionExpAuth):
         if session_id is None:
             return None
 
-        UserSession.load_from_file()
-        user_session = UserSession.search({
+        UserSession.refresh()
+        user_session = UserSession.first({
             'session_id': session_id
         })
 
-        if not user_session:
+        if user_session is None:
             return None
 
-        user_session = user_session[0]
-
         expired_time = user_session.created_at + \
             timedelta(seconds=self.session_duration)
 
@@ -60,18 +57,15 @@ class SessionDBAuth(SessionExpAuth):
         if not user_id:
             return False
 
-        user_session = UserSession.search({
+        user_session = UserSession.first({
             'session_id': session_id
         })
 
-        if not user_session:
+        if user_session is None:
             return False
 
-        user_session = user_session[0]
-
         try:
             user_session.remove()
-            UserSession.save_to_file()
         except Exception:
             return False
 
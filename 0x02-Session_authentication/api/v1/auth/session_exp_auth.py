@@ -2,19 +2,29 @@
 """Define SessionExpAuth class."""
 
 from api.v1.auth.session_auth import SessionAuth
+from api.v1.auth.session_store import ExpiringSessions
 from os import getenv
 from datetime import datetime, timedelta
 
 
 class SessionExpAuth(SessionAuth):
     '''SessionAuth class for session expiry.'''
+    user_id_by_session_id = ExpiringSessions()
 
     def __init__(self):
         '''Initialize instance'''
+        super().__init__()
         try:
             self.session_duration = int(getenv('SESSION_DURATION', 0))
         except ValueError:
             self.session_duration = 0
+        self.user_id_by_session_id.duration = self.session_duration
+        try:
+            sweep_interval = float(getenv('SESSION_SWEEP_INTERVAL', 0))
+        except ValueError:
+            sweep_interval = 0
+        if sweep_interval > 0:
+            self.user_id_by_session_id.start_sweeper(sweep_interval)
 
     def create_session(self, user_id=None):
         '''Create session associated with user id. '''
@@ -22,7 +32,7 @@ class SessionExpAuth(SessionAuth):
         if session_id is None:
             return None
 
-        SessionExpAuth.user_id_by_session_id[session_id] = {
+        self.user_id_by_session_id[session_id] = {
             'user_id': user_id,
             'created_at': datetime.now()
         }
@@ -34,8 +44,7 @@ class SessionExpAuth(SessionAuth):
         if session_id is None:
             return None
 
-        session_dict = SessionExpAuth.user_id_by_session_id.get(
-            session_id, None)
+        session_dict = self.user_id_by_session_id.get(session_id, None)
         if session_dict is None:
             return None
         if 'created_at' not in session_dict:
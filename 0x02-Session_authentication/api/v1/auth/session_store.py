@@ -0,0 +1,436 @@
+#!/usr/bin/env python3
+"""a module to store the API sessions
+"""
+
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+import fcntl
+import heapq
+import itertools
+import math
+import mmap
+import os
+import sqlite3
+import struct
+import tempfile
+import threading
+import time
+import zlib
+
+
+def encode(session) -> tuple:
+    '''returns the (user ID, creation timestamp) of a stored session'''
+    if isinstance(session, dict):
+        created_at = session.get('created_at')
+        return (session.get('user_id'),
+                None if created_at is None else created_at.timestamp())
+    return session, None
+
+
+def decode(user_id: str, created_at: float):
+    '''returns the session stored as (user ID, creation timestamp)'''
+    if created_at is None:
+        return user_id
+    return {'user_id': user_id,
+            'created_at': datetime.fromtimestamp(created_at)}
+
+
+class Sweeping:
+    """background eviction of the expired sessions of a store"""
+    _sweeper = None
+
+    def evict(self) -> int:
+        '''evicts the expired sessions and returns how many were'''
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        '''returns the session and eviction counts'''
+        return {'sessions': len(self), 'evictions': self.evictions}
+
+    def start_sweeper(self, interval: float = 60) -> None:
+        '''evicts expired sessions every interval seconds in a thread'''
+        if self._sweeper is not None:
+            return
+        stop = threading.Event()
+
+        def sweep():
+            while not stop.wait(interval):
+                self.evict()
+        self._sweeper = (threading.Thread(target=sweep, daemon=True), stop)
+        self._sweeper[0].start()
+
+    def stop_sweeper(self) -> None:
+        '''stops the background sweeper'''
+        if self._sweeper is not None:
+            self._sweeper[1].set()
+            self._sweeper[0].join()
+            self._sweeper = None
+
+
+class ExpiringSessions(Sweeping, dict):
+    """dict of session ID to session dict, evicting expired sessions
+
+    Every session dict with a 'created_at' is pushed on a min-heap of
+    expiry times; expired sessions are popped on later writes or by an
+    optional background sweeper.
+    """
+
+    def __init__(self, duration: int = 0):
+        '''initialize an empty store for sessions lasting duration seconds'''
+        super().__init__()
+        self.duration = duration
+        self.evictions = 0
+        self._heap = []
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def __setitem__(self, session_id: str, session) -> None:
+        '''stores a session and evicts the expired ones'''
+        super().__setitem__(session_id, session)
+        with self._lock:
+            if self.duration > 0 and isinstance(session, dict) \
+                    and 'created_at' in session:
+                expiry = session['created_at'] + \
+                    timedelta(seconds=self.duration)
+                heapq.heappush(self._heap, (expiry, next(self._counter),
+                                            session_id, session))
+            self._evict(datetime.now())
+
+    def _evict(self, now: datetime) -> int:
+        '''pops the sessions expired before now, lock held'''
+        evicted = 0
+        while self._heap and self._heap[0][0] < now:
+            _, _, session_id, session = heapq.heappop(self._heap)
+            if self.get(session_id) is session:
+                del self[session_id]
+                evicted += 1
+        self.evictions += evicted
+        return evicted
+
+    def evict(self) -> int:
+        '''evicts the expired sessions and returns how many were'''
+        with self._lock:
+            return self._evict(datetime.now())
+
+
+class SQLiteSessions(Sweeping, MutableMapping):
+    """sessions shared by processes in a sqlite3 file in WAL mode
+
+    Expired rows are deleted through an index on their expiry time on
+    every write.
+    """
+
+    def __init__(self, db_path: str = None):
+        '''opens SESSION_SQLITE_PATH lazily, one connection per thread'''
+        self.db_path = db_path or os.getenv('SESSION_SQLITE_PATH',
+                                            '.db_sessions.sqlite3')
+        self.duration = 0
+        self.evictions = 0
+        self._local = threading.local()
+
+    def connection(self) -> sqlite3.Connection:
+        '''returns the connection of the current thread and process'''
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS sessions '
+                         '(session_id TEXT PRIMARY KEY, user_id TEXT, '
+                         'created_at REAL, expires_at REAL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS sessions_expires_at '
+                         'ON sessions (expires_at)')
+            conn.commit()
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _evict(self, conn: sqlite3.Connection) -> int:
+        '''deletes the expired rows inside the current transaction'''
+        evicted = conn.execute('DELETE FROM sessions WHERE expires_at < ?',
+                               (time.time(),)).rowcount
+        self.evictions += evicted
+        return evicted
+
+    def __getitem__(self, session_id: str):
+        '''returns a session'''
+        row = self.connection().execute(
+            'SELECT user_id, created_at FROM sessions WHERE session_id = ?',
+            (session_id,)).fetchone()
+        if row is None:
+            raise KeyError(session_id)
+        return decode(*row)
+
+    def __setitem__(self, session_id: str, session) -> None:
+        '''stores a session and evicts the expired ones'''
+        user_id, created_at = encode(session)
+        expires_at = None
+        if self.duration > 0 and created_at is not None:
+            expires_at = created_at + self.duration
+        conn = self.connection()
+        with conn:
+            conn.execute('INSERT OR REPLACE INTO sessions '
+                         'VALUES (?, ?, ?, ?)',
+                         (session_id, user_id, created_at, expires_at))
+            self._evict(conn)
+
+    def __delitem__(self, session_id: str) -> None:
+        '''deletes a session'''
+        conn = self.connection()
+        with conn:
+            deleted = conn.execute('DELETE FROM sessions '
+                                   'WHERE session_id = ?',
+                                   (session_id,)).rowcount
+        if not deleted:
+            raise KeyError(session_id)
+
+    def __iter__(self):
+        '''iterates over the session IDs'''
+        return iter([row[0] for row in self.connection().execute(
+            'SELECT session_id FROM sessions')])
+
+    def __len__(self) -> int:
+        '''returns the number of sessions'''
+        return self.connection().execute(
+            'SELECT COUNT(*) FROM sessions').fetchone()[0]
+
+    def evict(self) -> int:
+        '''evicts the expired sessions and returns how many were'''
+        conn = self.connection()
+        with conn:
+            return self._evict(conn)
+
+
+EMPTY, USED, DELETED = 0, 1, 2
+HEADER = struct.Struct('<QQQQ')
+SLOT = struct.Struct('<B64s64sdd')
+ID_SIZE = 64
+
+
+class SharedMemorySessions(Sweeping, MutableMapping):
+    """sessions shared by processes in a memory mapped hash table
+
+    The file at SESSION_SHM_PATH, in /dev/shm when available, holds a
+    header (capacity, used, deleted, evictions) followed by capacity
+    fixed size slots of (state, session ID, user ID, created_at,
+    expires_at) probed linearly from the CRC32 of the session ID. A
+    flock on the file serializes the processes; expired slots met while
+    probing are evicted by writes. The table starts with
+    SESSION_SHM_CAPACITY slots and doubles whenever more than half of
+    them would be live, every process mapping it again on its next
+    access.
+    """
+
+    def __init__(self, path: str = None, capacity: int = None):
+        '''maps the table, creating it when the file is empty'''
+        if path is None:
+            shm = '/dev/shm' if os.path.isdir('/dev/shm') \
+                else tempfile.gettempdir()
+            path = os.getenv('SESSION_SHM_PATH',
+                             os.path.join(shm, 'api_sessions'))
+        self.path = path
+        self.duration = 0
+        self._lock = threading.Lock()
+        self._pid = None
+        fd = self.fd()
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(fd).st_size < HEADER.size:
+                capacity = capacity or int(os.getenv('SESSION_SHM_CAPACITY',
+                                                     65536))
+                os.ftruncate(fd, HEADER.size + capacity * SLOT.size)
+                os.pwrite(fd, HEADER.pack(capacity, 0, 0, 0), 0)
+            capacity = HEADER.unpack(os.pread(fd, HEADER.size, 0))[0]
+            self.capacity = capacity
+            self._map = mmap.mmap(fd, HEADER.size + capacity * SLOT.size)
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def fd(self) -> int:
+        '''returns the file descriptor of the current process, as flock
+        does not exclude processes sharing one'''
+        if self._pid != os.getpid():
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            self._pid = os.getpid()
+        return self._fd
+
+    @contextmanager
+    def locked(self, exclusive: bool = True):
+        '''holds the table lock, shared for readers'''
+        with self._lock:
+            fd = self.fd()
+            fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                self._remap()
+                yield
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def _remap(self) -> None:
+        '''maps the table again if another process grew it, lock held'''
+        capacity = HEADER.unpack_from(self._map)[0]
+        if capacity != self.capacity:
+            self._map = mmap.mmap(self.fd(),
+                                  HEADER.size + capacity * SLOT.size)
+            self.capacity = capacity
+
+    @property
+    def evictions(self) -> int:
+        '''returns the number of sessions evicted by all processes'''
+        return HEADER.unpack_from(self._map)[3]
+
+    def _count(self, used: int = 0, deleted: int = 0,
+               evictions: int = 0) -> None:
+        '''adds to the header counters, lock held'''
+        header = HEADER.unpack_from(self._map)
+        HEADER.pack_into(self._map, 0, header[0], header[1] + used,
+                         header[2] + deleted, header[3] + evictions)
+
+    @staticmethod
+    def _id(value: str) -> bytes:
+        '''returns an ID as the bytes of a slot field'''
+        encoded = value.encode()
+        if len(encoded) > ID_SIZE:
+            raise ValueError('ID longer than {} bytes'.format(ID_SIZE))
+        return encoded.ljust(ID_SIZE, b'\0')
+
+    def _probe(self, key: bytes, now: float = None) -> tuple:
+        '''returns the offset of the slot of key or None, and the offset
+        of the first free slot on its probe sequence; when now is given
+        the expired slots met are evicted, lock held'''
+        size = SLOT.size
+        start = zlib.crc32(key) % self.capacity
+        free = None
+        for n in range(self.capacity):
+            offset = HEADER.size + (start + n) % self.capacity * size
+            state = self._map[offset]
+            if state == EMPTY:
+                return None, offset if free is None else free
+            if state == USED:
+                if self._map[offset + 1:offset + 1 + ID_SIZE] == key:
+                    return offset, None
+                if now is not None:
+                    expires_at = SLOT.unpack_from(self._map, offset)[4]
+                    if expires_at < now:
+                        self._map[offset] = DELETED
+                        self._count(-1, 1, 1)
+                        state = DELETED
+            if state == DELETED and free is None:
+                free = offset
+        return None, free
+
+    def _rehash(self) -> None:
+        '''rehashes the live sessions without tombstones, doubling the
+        table until at most half of it is used, lock held'''
+        now = time.time()
+        slots = self._map[HEADER.size:]
+        live = [slot for slot in (slots[i:i + SLOT.size]
+                                  for i in range(0, len(slots), SLOT.size))
+                if slot[0] == USED and not
+                SLOT.unpack(slot)[4] < now]
+        header = HEADER.unpack_from(self._map)
+        capacity = self.capacity
+        while (len(live) + 1) * 2 > capacity:
+            capacity *= 2
+        if capacity != self.capacity:
+            os.ftruncate(self.fd(), HEADER.size + capacity * SLOT.size)
+            self._map = mmap.mmap(self.fd(),
+                                  HEADER.size + capacity * SLOT.size)
+            self.capacity = capacity
+        self._map[HEADER.size:] = bytes(capacity * SLOT.size)
+        for slot in live:
+            offset = self._probe(slot[1:1 + ID_SIZE])[1]
+            self._map[offset:offset + SLOT.size] = slot
+        HEADER.pack_into(self._map, 0, capacity, len(live), 0,
+                         header[3] + header[1] - len(live))
+
+    def __getitem__(self, session_id: str):
+        '''returns a session'''
+        key = self._id(session_id)
+        with self.locked(False):
+            offset = self._probe(key)[0]
+            if offset is None:
+                raise KeyError(session_id)
+            _, _, user_id, created_at, _ = SLOT.unpack_from(self._map,
+                                                            offset)
+        return decode(user_id.rstrip(b'\0').decode(),
+                      None if math.isnan(created_at) else created_at)
+
+    def __setitem__(self, session_id: str, session) -> None:
+        '''stores a session and evicts the expired ones on its way'''
+        key = self._id(session_id)
+        user_id, created_at = encode(session)
+        expires_at = math.inf
+        if created_at is None:
+            created_at = math.nan
+        elif self.duration > 0:
+            expires_at = created_at + self.duration
+        slot = SLOT.pack(USED, key, self._id(user_id), created_at,
+                         expires_at)
+        with self.locked():
+            offset, free = self._probe(key, time.time())
+            if offset is None:
+                used, deleted = HEADER.unpack_from(self._map)[1:3]
+                if (used + deleted + 1) * 4 > self.capacity * 3:
+                    self._rehash()
+                    offset, free = self._probe(key)
+            if offset is None:
+                offset = free
+                self._count(1, -1 if self._map[offset] == DELETED else 0)
+            self._map[offset:offset + SLOT.size] = slot
+
+    def __delitem__(self, session_id: str) -> None:
+        '''deletes a session'''
+        key = self._id(session_id)
+        with self.locked():
+            offset = self._probe(key)[0]
+            if offset is None:
+                raise KeyError(session_id)
+            self._map[offset] = DELETED
+            self._count(-1, 1)
+
+    def __iter__(self):
+        '''iterates over the session IDs'''
+        with self.locked(False):
+            slots = self._map[HEADER.size:]
+        return iter([slots[i + 1:i + 1 + ID_SIZE].rstrip(b'\0').decode()
+                     for i in range(0, len(slots), SLOT.size)
+                     if slots[i] == USED])
+
+    def __len__(self) -> int:
+        '''returns the number of sessions'''
+        return HEADER.unpack_from(self._map)[1]
+
+    def evict(self) -> int:
+        '''evicts the expired sessions and returns how many were'''
+        now = time.time()
+        evicted = 0
+        with self.locked():
+            for offset in range(HEADER.size, len(self._map), SLOT.size):
+                if self._map[offset] == USED and \
+                        SLOT.unpack_from(self._map, offset)[4] < now:
+                    self._map[offset] = DELETED
+                    evicted += 1
+            self._count(-evicted, evicted, evicted)
+        return evicted
+
+
+STORES = {
+    'sqlite': SQLiteSessions,
+    'shm': SharedMemorySessions,
+}
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def open_store(name: str = None):
+    '''returns the shared store named by SESSION_STORE, None to keep the
+    sessions in the memory of the process'''
+    name = name or os.getenv('SESSION_STORE', 'memory')
+    if name not in STORES:
+        return None
+    with _stores_lock:
+        if name not in _stores:
+            _stores[name] = STORES[name]()
+        return _stores[name]
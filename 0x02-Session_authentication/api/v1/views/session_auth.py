@@ -19,16 +19,14 @@ def login():
     if not password:
         return jsonify({"error": "password missing"}), 400
     try:
-        users_found = User.search({'email': email})
+        user = User.first({'email': email})
     except Exception:
         return jsonify({"error": "no user found for this email"}), 404
-    if not users_found:
+    if user is None:
         return jsonify({"error": "no user found for this email"}), 404
-    for user in users_found:
-        if not user.is_valid_password(password):
-            return jsonify({"error": "wrong password"}), 401
+    if not user.is_valid_password(password):
+        return jsonify({"error": "wrong password"}), 401
     from api.v1.app import auth
-    user = users_found[0]
     session_id = auth.create_session(user.id)
     SESSION_NAME = getenv('SESSION_NAME')
     response = jsonify(user.to_json())
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+""" Benchmarks for the models storage
+"""
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from uuid import uuid4
+import models.base
+import models.engine.json_storage
+
+
+def write_users(count: int, jsonl: bool) -> None:
+    """ Write count users to the store of the current directory """
+    def users():
+        for i in range(count):
+            obj_id = str(uuid4())
+            yield obj_id, {"id": obj_id, "created_at": "2024-02-17T11:15:03",
+                           "updated_at": "2024-02-17T11:15:03",
+                           "email": "user{}@hbtn.io".format(i),
+                           "_password": "a5c904771b8617de27d3511d1f5380"
+                                        "94e26c120da663363b3f760f7b894f9d69",
+                           "first_name": None, "last_name": None}
+    if jsonl:
+        with open(".db_User.jsonl", "w") as f:
+            for _, obj_json in users():
+                f.write(json.dumps(obj_json) + "\n")
+    else:
+        with open(".db_User.json", "w") as f:
+            json.dump(dict(users()), f)
+
+
+def bench_startup(*sizes: str) -> None:
+    """ Times User.load_from_file and its peak memory per format """
+    from models.user import User
+    for size in map(int, sizes or (10000, 100000, 1000000)):
+        for db_format in ("json", "jsonl"):
+            with tempfile.TemporaryDirectory() as tmp:
+                os.chdir(tmp)
+                write_users(size, db_format == "jsonl")
+                models.base.storage.db_format = db_format
+                start = time.perf_counter()
+                User.load_from_file()
+                elapsed = time.perf_counter() - start
+                models.engine.json_storage.DATA.clear()
+                tracemalloc.start()
+                User.load_from_file()
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                models.engine.json_storage.DATA.clear()
+                print("{:>8} users {:<6} {:8.2f} s {:8.1f} MB peak".format(
+                    size, db_format, elapsed, peak / 2 ** 20))
+
+
+class DictUser():
+    """ Per-instance __dict__ layout of User, for comparison """
+
+    def __init__(self, **kwargs):
+        self.id = kwargs.get("id")
+        self.created_at = kwargs.get("created_at")
+        self.updated_at = kwargs.get("updated_at")
+        self.email = kwargs.get("email")
+        self._password = kwargs.get("_password")
+        self.first_name = kwargs.get("first_name")
+        self.last_name = kwargs.get("last_name")
+
+
+def bench_memory(*sizes: str) -> None:
+    """ Compares the memory held by User and __dict__ based instances """
+    from models.user import User
+    for size in map(int, sizes or (100000,)):
+        for name, klass in (("__dict__", DictUser), ("__slots__", User)):
+            tracemalloc.start()
+            objs = [klass(id=str(i), created_at="2024-02-17T11:15:03",
+                          updated_at="2024-02-17T11:15:03",
+                          email="user{}@hbtn.io".format(i))
+                    for i in range(size)]
+            held = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            del objs
+            print("{:>8} users {:<9} {:8.1f} MB {:6.0f} B/user".format(
+                size, name, held / 2 ** 20, held / size))
+
+
+def create_users(count: int) -> None:
+    """ Save count users from the current process """
+    from models.user import User
+    for i in range(count):
+        user = User()
+        user.email = "{}-{}@hbtn.io".format(os.getpid(), i)
+        user.save()
+
+
+def bench_processes(workers: str = "4", count: str = "200") -> None:
+    """ Saves users from several processes at once and exits with an
+    error if any of the writes is lost """
+    from models.user import User
+    workers, count = int(workers), int(count)
+    lost = []
+    for mode in ("file", "journal"):
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp)
+            models.base.storage.mode = mode
+            User.load_from_file()
+            start = time.perf_counter()
+            procs = [multiprocessing.Process(target=create_users,
+                                             args=(count,))
+                     for _ in range(workers)]
+            for proc in procs:
+                proc.start()
+            for proc in procs:
+                proc.join()
+            elapsed = time.perf_counter() - start
+            User.load_from_file()
+            print("{:<8} {} processes {:8.0f} saves/s {:>6}/{} users".format(
+                mode, workers, workers * count / elapsed, User.count(),
+                workers * count))
+            if User.count() != workers * count:
+                lost.append(mode)
+    if lost:
+        sys.exit("writes lost in {} mode".format(", ".join(lost)))
+
+
+def bench_query(size: str = "100000", number: str = "20") -> None:
+    """ Compares predicate searches with filtering User.all() in Python,
+    on the JSON engine """
+    from models.query import In, Prefix, Range
+    from models.user import User
+    size, number = int(size), int(number)
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        write_users(size, False)
+        User.load_from_file()
+        emails = ["user{}@hbtn.io".format(i) for i in range(0, size, 997)]
+        start, end = datetime(2024, 2, 17, 11), datetime(2024, 2, 17, 12)
+        cases = (
+            ("email prefix", {"email": Prefix("user4242")},
+             lambda u: u.email.startswith("user4242")),
+            ("email IN", {"email": In(emails)},
+             lambda u: u.email in emails),
+            ("created_at range", {"created_at": Range(start, end)},
+             lambda u: start <= u.created_at < end),
+            ("first_name prefix", {"first_name": Prefix("Bob")},
+             lambda u: (u.first_name or "").startswith("Bob")),
+        )
+        for name, attributes, check in cases:
+            timings = []
+            for func in (lambda: User.search(attributes),
+                         lambda: [u for u in User.all() if check(u)]):
+                func()
+                begin = time.perf_counter()
+                for _ in range(number):
+                    func()
+                timings.append((time.perf_counter() - begin) / number)
+            print("{:<18} query {:9.3f} ms  python {:9.3f} ms".format(
+                name, timings[0] * 1e3, timings[1] * 1e3))
+        models.engine.json_storage.DATA.clear()
+
+
+def bench_sessions(*sizes: str) -> None:
+    """ Measures SessionDBAuth lookups per second as sessions grow,
+    against reloading the file on every request """
+    from api.v1.auth.session_db_auth import SessionDBAuth
+    from models.user_session import UserSession
+    auth = SessionDBAuth()
+    auth.session_duration = 3600
+    for size in map(int, sizes or (1000, 10000, 100000)):
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp)
+            UserSession.load_from_file()
+            sessions = [UserSession(user_id=str(i), session_id=str(uuid4()))
+                        for i in range(size)]
+            UserSession.bulk_save(sessions)
+            ids = [s.session_id for s in sessions[::max(size // 100, 1)]]
+
+            def reload_lookup(session_id):
+                UserSession.load_from_file()
+                return UserSession.search({'session_id': session_id})
+
+            rates = []
+            for lookup in (auth.user_id_for_session_id, reload_lookup):
+                count, start = 0, time.perf_counter()
+                while time.perf_counter() - start < 1:
+                    for session_id in ids:
+                        lookup(session_id)
+                    count += len(ids)
+                rates.append(count / (time.perf_counter() - start))
+            print("{:>8} sessions cached {:10.0f} req/s "
+                  "reload {:8.1f} req/s".format(size, *rates))
+
+
+def session_store_worker(name: str, path: str, count: int, ids,
+                         lookups=None) -> None:
+    """ Creates count sessions through SessionAuth, or looks up the
+    sessions of every process, against the store name at path """
+    from api.v1.auth.session_auth import SessionAuth
+    from api.v1.auth.session_store import STORES
+    auth = SessionAuth()
+    auth.user_id_by_session_id = STORES[name](path)
+    start = time.perf_counter()
+    if lookups is None:
+        result = [auth.create_session(str(i)) for i in range(count)]
+    else:
+        result = sum(auth.user_id_for_session_id(session_id) is not None
+                     for session_id in lookups)
+    ids.put((result, time.perf_counter() - start))
+
+
+def bench_session_stores(workers: str = "4", count: str = "2000") -> None:
+    """ Creates then looks up sessions from several processes at once,
+    growing the shared memory table from 1024 slots, and exits with an
+    error unless every process sees the sessions of the others """
+    workers, count = int(workers), int(count)
+    os.environ["SESSION_SHM_CAPACITY"] = "1024"
+    missing = []
+    for name in ("sqlite", "shm"):
+        with tempfile.TemporaryDirectory(dir="/dev/shm" if os.path.isdir(
+                "/dev/shm") else None) as tmp:
+            path = os.path.join(tmp, "sessions")
+            queue = multiprocessing.Queue()
+            rates, lookups = [], None
+            for phase in range(2):
+                procs = [multiprocessing.Process(
+                    target=session_store_worker,
+                    args=(name, path, count, queue, lookups))
+                    for _ in range(workers)]
+                for proc in procs:
+                    proc.start()
+                results, elapsed = zip(*(queue.get() for _ in procs))
+                for proc in procs:
+                    proc.join()
+                rates.append(workers * count / max(elapsed))
+                if lookups is None:
+                    lookups = [session_id for ids in results
+                               for session_id in ids][::workers]
+            print("{:<7} {} processes create {:8.0f} sessions/s "
+                  "lookup {:8.0f} req/s {:>6}/{} found".format(
+                      name, workers, rates[0], rates[1], sum(results),
+                      workers * len(lookups)))
+            if sum(results) != workers * len(lookups):
+                missing.append(name)
+    if missing:
+        sys.exit("sessions missing from the {} store".format(
+            ", ".join(missing)))
+
+
+BENCHMARKS = {
+    "startup": bench_startup,
+    "memory": bench_memory,
+    "processes": bench_processes,
+    "query": bench_query,
+    "sessions": bench_sessions,
+    "session_stores": bench_session_stores,
+}
+
+
+if __name__ == "__main__":
+    names = sys.argv[1:2] or list(BENCHMARKS)
+    for name in names:
+        print("== {}".format(name))
+        BENCHMARKS[name](*sys.argv[2:])
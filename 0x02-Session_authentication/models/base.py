@@ -2,36 +2,90 @@
 """ Base module
 """
 from datetime import datetime
-from typing import TypeVar, List, Iterable
-from os import path
-import json
+from typing import TypeVar, List, Iterable, Iterator
+from os import getenv
 import uuid
 
 
 TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
-DATA = {}
+
+if getenv('DB_ENGINE') == 'sqlite':
+    from models.engine.sqlite_storage import SQLiteStorage
+    storage = SQLiteStorage()
+else:
+    from models.engine.json_storage import JSONStorage
+    storage = JSONStorage()
+
+
+def parse_timestamp(value: str) -> datetime:
+    """ Parse a TIMESTAMP_FORMAT string
+    """
+    if len(value) == 19 and value[10] == 'T' \
+            and value[13] == ':' and value[16] == ':':
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            pass
+    return datetime.strptime(value, TIMESTAMP_FORMAT)
+
+
+class Timestamp():
+    """ Datetime attribute kept as its stored string until first read
+    """
+
+    def __set_name__(self, owner: type, name: str):
+        """ Bind to the attribute name and its '_' prefixed slot
+        """
+        self.name = name
+        self.slot = '_' + name
+
+    def __get__(self, obj, objtype: type = None) -> datetime:
+        """ Parse the stored string on first access
+        """
+        if obj is None:
+            return self
+        value = getattr(obj, self.slot)
+        if type(value) is str:
+            value = parse_timestamp(value)
+            setattr(obj, self.slot, value)
+        return value
+
+    def __set__(self, obj, value: datetime):
+        """ Store a new value
+        """
+        setattr(obj, self.slot, value)
 
 
 class Base():
     """ Base class
     """
 
+    __slots__ = ('id', '_created_at', '_updated_at')
+    json_fields = (('id', 'id'), ('created_at', '_created_at'),
+                   ('updated_at', '_updated_at'))
+    indexed_attributes = ()
+    created_at = Timestamp()
+    updated_at = Timestamp()
+
+    def __init_subclass__(cls, **kwargs):
+        """ Append the slots of a subclass to its JSON fields
+        """
+        super().__init_subclass__(**kwargs)
+        cls.json_fields = cls.json_fields + tuple(
+            (slot, slot) for slot in cls.__dict__.get('__slots__', ()))
+
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a Base instance
         """
-        s_class = str(self.__class__.__name__)
-        if DATA.get(s_class) is None:
-            DATA[s_class] = {}
+        storage.register(self.__class__)
 
-        self.id = kwargs.get('id', str(uuid.uuid4()))
+        self.id = kwargs['id'] if 'id' in kwargs else str(uuid.uuid4())
         if kwargs.get('created_at') is not None:
-            self.created_at = datetime.strptime(kwargs.get('created_at'),
-                                                TIMESTAMP_FORMAT)
+            self.created_at = kwargs.get('created_at')
         else:
             self.created_at = datetime.utcnow()
         if kwargs.get('updated_at') is not None:
-            self.updated_at = datetime.strptime(kwargs.get('updated_at'),
-                                                TIMESTAMP_FORMAT)
+            self.updated_at = kwargs.get('updated_at')
         else:
             self.updated_at = datetime.utcnow()
 
@@ -45,10 +99,11 @@ class Base():
         return (self.id == other.id)
 
     def to_json(self, for_serialization: bool = False) -> dict:
-        """ Convert the object a JSON dictionary
+        """ Convert the object a JSON dictionary, reusing timestamps that
+        were never read
         """
         result = {}
-        for key, value in self.__dict__.items():
+        for key, value in self.attributes():
             if not for_serialization and key[0] == '_':
                 continue
             if type(value) is datetime:
@@ -57,82 +112,115 @@ class Base():
                 result[key] = value
         return result
 
+    def attributes(self) -> Iterable[tuple]:
+        """ Iterate over the stored (name, value) pairs
+        """
+        for key, slot in self.json_fields:
+            try:
+                yield key, getattr(self, slot)
+            except AttributeError:
+                continue
+        yield from getattr(self, '__dict__', {}).items()
+
     @classmethod
     def load_from_file(cls):
-        """ Load all objects from file
+        """ Load all objects from storage
         """
-        s_class = cls.__name__
-        file_path = ".db_{}.json".format(s_class)
-        DATA[s_class] = {}
-        if not path.exists(file_path):
-            return
+        storage.load(cls)
 
-        with open(file_path, 'r') as f:
-            objs_json = json.load(f)
-            for obj_id, obj_json in objs_json.items():
-                DATA[s_class][obj_id] = cls(**obj_json)
+    @classmethod
+    def refresh(cls) -> bool:
+        """ Reload all objects only if their storage changed, as every read
+        below does first to see the writes of other processes
+        """
+        return storage.refresh(cls)
 
     @classmethod
     def save_to_file(cls):
-        """ Save all objects to file
+        """ Save all objects to storage
         """
-        s_class = cls.__name__
-        file_path = ".db_{}.json".format(s_class)
-        objs_json = {}
-        for obj_id, obj in DATA[s_class].items():
-            objs_json[obj_id] = obj.to_json(True)
+        storage.dump(cls)
 
-        with open(file_path, 'w') as f:
-            json.dump(objs_json, f)
+    @classmethod
+    def batch(cls):
+        """ Defer the writes of a block, flushed once when it exits and
+        rolled back if it raises
+        """
+        return storage.batch()
+
+    @classmethod
+    def bulk_save(cls, objs: Iterable[TypeVar('Base')]):
+        """ Save many objects with a single write
+        """
+        with cls.batch():
+            for obj in objs:
+                obj.save()
 
     def save(self):
         """ Save current object
         """
-        s_class = self.__class__.__name__
         self.updated_at = datetime.utcnow()
-        DATA[s_class][self.id] = self
-        self.__class__.save_to_file()
+        storage.save(self)
 
     def remove(self):
         """ Remove object
         """
-        s_class = self.__class__.__name__
-        if DATA[s_class].get(self.id) is not None:
-            del DATA[s_class][self.id]
-            self.__class__.save_to_file()
+        storage.remove(self)
 
     @classmethod
     def count(cls) -> int:
         """ Count all objects
         """
-        s_class = cls.__name__
-        return len(DATA[s_class].keys())
+        storage.refresh(cls)
+        return storage.count(cls)
 
     @classmethod
     def all(cls) -> Iterable[TypeVar('Base')]:
         """ Return all objects
         """
-        return cls.search()
+        storage.refresh(cls)
+        return storage.all(cls)
 
     @classmethod
     def get(cls, id: str) -> TypeVar('Base'):
         """ Return one object by ID
         """
-        s_class = cls.__name__
-        return DATA[s_class].get(id)
+        storage.refresh(cls)
+        return storage.get(cls, id)
 
     @classmethod
     def search(cls, attributes: dict = {}) -> List[TypeVar('Base')]:
         """ Search all objects with matching attributes
         """
-        s_class = cls.__name__
+        storage.refresh(cls)
+        return storage.search(cls, attributes)
 
-        def _search(obj):
-            if len(attributes) == 0:
-                return True
-            for k, v in attributes.items():
-                if (getattr(obj, k) != v):
-                    return False
-            return True
+    @classmethod
+    def iter_search(cls, attributes: dict = {}, limit: int = None,
+                    offset: int = 0,
+                    after_id: str = None) -> Iterator[TypeVar('Base')]:
+        """ Lazily iterate over the objects with matching attributes,
+        starting after the object with ID after_id, skipping offset
+        matches and stopping after limit ones
+        """
+        storage.refresh(cls)
+        return storage.iter_search(cls, attributes, limit, offset, after_id)
 
-        return list(filter(_search, DATA[s_class].values()))
+    @classmethod
+    def iter_all(cls, limit: int = None, offset: int = 0,
+                 after_id: str = None) -> Iterator[TypeVar('Base')]:
+        """ Lazily iterate over one page of all objects
+        """
+        return cls.iter_search({}, limit, offset, after_id)
+
+    @classmethod
+    def first(cls, attributes: dict = {}) -> TypeVar('Base'):
+        """ Return the first object with matching attributes or None
+        """
+        return next(cls.iter_search(attributes, 1), None)
+
+    @classmethod
+    def exists(cls, attributes: dict = {}) -> bool:
+        """ Check whether an object has matching attributes
+        """
+        return cls.first(attributes) is not None
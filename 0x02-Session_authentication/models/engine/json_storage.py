@@ -0,0 +1,537 @@
+#!/usr/bin/env python3
+""" JSON file storage module
+"""
+from bisect import bisect_left
+from contextlib import contextmanager
+from itertools import islice
+from typing import TypeVar, List, Iterable, Iterator, Optional
+from os import getenv, path, replace, stat
+import fcntl
+import json
+import threading
+from models.engine.storage import Storage, paginate
+from models.query import In, Predicate, Range
+
+
+DATA = {}
+INDEXES = {}
+JOURNAL_SIZES = {}
+SIGNATURES = {}
+GENERATIONS = {}
+SWAP_LOCK = threading.Lock()
+
+
+class Objects(dict):
+    """ Objects of a class by ID, remembering the position of each ID in
+    insertion order so that scans can start right after any ID and keep
+    going while objects are saved or removed
+    """
+
+    def __init__(self):
+        """ Initialize an empty store
+        """
+        super().__init__()
+        self.order = []
+        self.positions = {}
+        self._lock = threading.Lock()
+
+    def __setitem__(self, obj_id: str, obj: TypeVar('Base')):
+        """ Store an object, appending its ID to the order if new
+        """
+        if obj_id not in self.positions:
+            with self._lock:
+                if obj_id not in self.positions:
+                    self.positions[obj_id] = len(self.order)
+                    self.order.append(obj_id)
+        super().__setitem__(obj_id, obj)
+
+    def __delitem__(self, obj_id: str):
+        """ Drop an object, leaving a hole in the order until compaction
+        """
+        with self._lock:
+            super().__delitem__(obj_id)
+            self.order[self.positions.pop(obj_id)] = None
+            if len(self.order) > 2 * len(self) + 64:
+                self.order = list(self.keys())
+                self.positions = {obj_id: i
+                                  for i, obj_id in enumerate(self.order)}
+
+    def pop(self, obj_id: str, *default):
+        """ Drop and return an object, or default if absent
+        """
+        obj = self.get(obj_id)
+        if obj is None:
+            if default:
+                return default[0]
+            raise KeyError(obj_id)
+        try:
+            del self[obj_id]
+        except KeyError:
+            pass
+        return obj
+
+    def scan(self, after_id: str = None) -> Iterator[TypeVar('Base')]:
+        """ Lazily yield the objects in insertion order, starting right
+        after the object with ID after_id
+        """
+        start = 0
+        if after_id is not None:
+            start = self.positions.get(after_id)
+            if start is None:
+                return iter(())
+            start += 1
+        return filter(None, map(self.get, islice(self.order, start, None)))
+
+
+class Index():
+    """ Exact-match index of one attribute over saved objects
+    """
+
+    def __init__(self):
+        """ Initialize an empty index
+        """
+        self.ids = {}
+        self.values = {}
+        self.sorted = None
+
+    def add(self, obj_id: str, value) -> None:
+        """ Index an object ID under a value
+        """
+        if obj_id in self.values:
+            if self.values[obj_id] == value:
+                return
+            self.discard(obj_id)
+        try:
+            if value not in self.ids:
+                self.ids[value] = {}
+                self.sorted = None
+        except TypeError:
+            return
+        self.ids[value][obj_id] = None
+        self.values[obj_id] = value
+
+    def discard(self, obj_id: str) -> None:
+        """ Remove an object ID from the index
+        """
+        if obj_id not in self.values:
+            return
+        value = self.values.pop(obj_id)
+        bucket = self.ids[value]
+        del bucket[obj_id]
+        if len(bucket) == 0:
+            del self.ids[value]
+            self.sorted = None
+
+    def lookup(self, value) -> Iterable[str]:
+        """ Return the IDs indexed under a value
+        """
+        return self.ids.get(value, {}).keys()
+
+    def lookup_in(self, values: Iterable) -> List[str]:
+        """ Return the IDs indexed under any of several values
+        """
+        return [obj_id for value in dict.fromkeys(values)
+                for obj_id in self.ids.get(value, ())]
+
+    def lookup_range(self, start, end) -> List[str]:
+        """ Return the IDs indexed under values within [start, end), in
+        value order; raise TypeError if the values are not comparable
+        """
+        if self.sorted is None:
+            self.sorted = sorted(v for v in self.ids if v is not None)
+        lo = 0 if start is None else bisect_left(self.sorted, start)
+        hi = len(self.sorted) if end is None \
+            else bisect_left(self.sorted, end)
+        return [obj_id for value in self.sorted[lo:hi]
+                for obj_id in self.ids[value]]
+
+
+class JSONStorage(Storage):
+    """ Objects kept in DATA and persisted to .db_<Class>.json files,
+    shared between processes through advisory locks on .db_<Class>.lock
+    """
+
+    def __init__(self):
+        """ Read the DB_STORAGE, DB_FORMAT and DB_JOURNAL_THRESHOLD
+        settings
+        """
+        self.mode = getenv('DB_STORAGE', 'file')
+        self.db_format = getenv('DB_FORMAT', 'json')
+        self.journal_threshold = int(getenv('DB_JOURNAL_THRESHOLD', 1000))
+        self._local = threading.local()
+
+    def register(self, cls: type):
+        """ Create the in-memory store of a class
+        """
+        if DATA.get(cls.__name__) is None:
+            self.swap(cls, Objects(), self.new_indexes(cls))
+
+    def swap(self, cls: type, objs: dict, indexes: dict):
+        """ Replace the objects and indexes of a class in one step
+        """
+        with SWAP_LOCK:
+            DATA[cls.__name__] = objs
+            INDEXES[cls.__name__] = indexes
+            GENERATIONS[cls.__name__] = GENERATIONS.get(cls.__name__, 0) + 1
+
+    def generation(self, cls: type) -> int:
+        """ Return a counter of the reloads and replays of a class, which
+        may have overwritten in-memory writes not yet persisted
+        """
+        return GENERATIONS.get(cls.__name__, 0)
+
+    def snapshot(self, cls: type) -> tuple:
+        """ Return the objects and indexes of a class from the same load
+        """
+        with SWAP_LOCK:
+            return DATA[cls.__name__], INDEXES[cls.__name__]
+
+    @contextmanager
+    def lock(self, cls: type, exclusive: bool = True):
+        """ Hold the file lock of a class, shared for readers; nested
+        calls in the same thread reuse the outer lock, which cannot be
+        upgraded from shared to exclusive without letting another
+        process in between
+        """
+        held = self._local.__dict__.setdefault('locks', {})
+        s_class = cls.__name__
+        if s_class in held:
+            if exclusive and not held[s_class]:
+                raise RuntimeError("{} is locked shared, not exclusive"
+                                   .format(s_class))
+            yield
+            return
+        with open(".db_{}.lock".format(s_class), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            held[s_class] = exclusive
+            try:
+                yield
+            finally:
+                del held[s_class]
+
+    def held(self, cls: type) -> Optional[bool]:
+        """ Return True if the current thread holds the lock of a class
+        exclusive, False if shared and None if not at all
+        """
+        return self._local.__dict__.get('locks', {}).get(cls.__name__)
+
+    def signature(self, cls: type) -> tuple:
+        """ Return the (snapshot inode/mtime/size, journal inode, journal
+        size) of a class to detect writes by other processes
+        """
+        s_class = cls.__name__
+        file_path = ".db_{}.json".format(s_class)
+        if self.db_format == 'jsonl':
+            file_path += 'l'
+        try:
+            st = stat(file_path)
+            snapshot = (st.st_ino, st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            snapshot = None
+        try:
+            st = stat(".db_{}.journal".format(s_class))
+            return snapshot, st.st_ino, st.st_size
+        except FileNotFoundError:
+            return snapshot, None, 0
+
+    def refresh(self, cls: type) -> bool:
+        """ Reload a class if its files changed since they were last read
+        or written, replaying only the new journal records when possible;
+        inside a batch, whose writes are not persisted yet, it does not
+        """
+        if getattr(self._local, 'dirty', None) is not None:
+            return False
+        known = SIGNATURES.get(cls.__name__)
+        if known is not None and known == self.signature(cls):
+            return False
+        with self.lock(cls, False):
+            current = self.signature(cls)
+            if known is not None and known[:2] == current[:2] \
+                    and known[2] < current[2]:
+                self.replay_journal(cls, known[2])
+            elif known != current:
+                self.load(cls)
+        return True
+
+    def load(self, cls: type):
+        """ Load all objects from file, then replay the journal, into new
+        objects and indexes swapped in once complete so that readers see
+        either the previous load or this one; a JSON snapshot is rewritten
+        as JSON lines with DB_FORMAT=jsonl, unless the lock is held shared
+        and the next write does it
+        """
+        s_class = cls.__name__
+        file_path = ".db_{}.json".format(s_class)
+        convert = False
+        objs, indexes = Objects(), self.new_indexes(cls)
+        with self.lock(cls, False):
+            if self.db_format == 'jsonl' and path.exists(file_path + 'l'):
+                with open(file_path + 'l', 'r') as f:
+                    for line in f:
+                        self.load_object(cls, json.loads(line), None,
+                                         objs, indexes)
+            elif path.exists(file_path):
+                with open(file_path, 'r') as f:
+                    objs_json = json.load(f)
+                    for obj_id, obj_json in objs_json.items():
+                        self.load_object(cls, obj_json, obj_id,
+                                         objs, indexes)
+                convert = self.db_format == 'jsonl'
+            records = self.read_journal(cls)
+            for record in records:
+                self.apply(cls, record, objs, indexes)
+            self.swap(cls, objs, indexes)
+            JOURNAL_SIZES[s_class] = len(records)
+            SIGNATURES[s_class] = self.signature(cls)
+        if convert:
+            mode = self.held(cls)
+            if mode is None:
+                with self.lock(cls):
+                    self.refresh(cls)
+                    self.dump(cls)
+            elif mode:
+                self.dump(cls)
+
+    def load_object(self, cls: type, obj_json: dict, obj_id: str = None,
+                    objs: dict = None, indexes: dict = None):
+        """ Instantiate and index one stored object, into the live objects
+        of its class unless others are given
+        """
+        obj = cls(**obj_json)
+        if objs is None:
+            objs = DATA[cls.__name__]
+        objs[obj_id or obj.id] = obj
+        self.index(obj, indexes)
+
+    def apply(self, cls: type, record: dict, objs: dict = None,
+              indexes: dict = None):
+        """ Apply one journal record in memory
+        """
+        if objs is None:
+            objs = DATA[cls.__name__]
+        if record['op'] == 'save':
+            self.load_object(cls, record['obj'], None, objs, indexes)
+        elif objs.pop(record['id'], None) is not None:
+            self.unindex(cls, record['id'], indexes)
+
+    def read_journal(self, cls: type, offset: int = 0) -> List[dict]:
+        """ Return the complete mutations appended to the journal after
+        offset, skipping the lines torn by a crash
+        """
+        records = []
+        journal_path = ".db_{}.journal".format(cls.__name__)
+        if path.exists(journal_path):
+            with open(journal_path, 'rb') as f:
+                f.seek(offset)
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        break
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        continue
+        return records
+
+    def replay_journal(self, cls: type, offset: int = 0):
+        """ Apply the mutations appended to the journal after offset
+        """
+        s_class = cls.__name__
+        records = self.read_journal(cls, offset)
+        for record in records:
+            self.apply(cls, record)
+        if records:
+            with SWAP_LOCK:
+                GENERATIONS[s_class] = GENERATIONS.get(s_class, 0) + 1
+        JOURNAL_SIZES[s_class] = JOURNAL_SIZES.get(s_class, 0) + len(records)
+        SIGNATURES[s_class] = self.signature(cls)
+
+    def dump(self, cls: type):
+        """ Save all objects to file, one per line with DB_FORMAT=jsonl,
+        and empty the journal
+        """
+        s_class = cls.__name__
+        file_path = ".db_{}.json".format(s_class)
+        journal_path = ".db_{}.journal".format(s_class)
+        with self.lock(cls):
+            if self.db_format == 'jsonl':
+                file_path += 'l'
+                with open(file_path + '.tmp', 'w') as f:
+                    for obj in DATA[s_class].values():
+                        f.write(json.dumps(obj.to_json(True)) + '\n')
+            else:
+                objs_json = {}
+                for obj_id, obj in DATA[s_class].items():
+                    objs_json[obj_id] = obj.to_json(True)
+                with open(file_path + '.tmp', 'w') as f:
+                    json.dump(objs_json, f)
+            replace(file_path + '.tmp', file_path)
+            if JOURNAL_SIZES.get(s_class) or path.exists(journal_path):
+                open(journal_path, 'w').close()
+            JOURNAL_SIZES[s_class] = 0
+            SIGNATURES[s_class] = self.signature(cls)
+
+    def append_to_journal(self, cls: type, records: List[dict]):
+        """ Append mutations to the journal in one write, on a new line if
+        a crash left the last one torn, compacting it into the snapshot
+        once it grows past DB_JOURNAL_THRESHOLD records
+        """
+        s_class = cls.__name__
+        journal_path = ".db_{}.journal".format(s_class)
+        with self.lock(cls):
+            with open(journal_path, 'ab+') as f:
+                lines = ''.join(json.dumps(r) + '\n' for r in records)
+                if f.seek(0, 2):
+                    f.seek(-1, 2)
+                    if f.read(1) != b'\n':
+                        lines = '\n' + lines
+                f.write(lines.encode())
+            JOURNAL_SIZES[s_class] = JOURNAL_SIZES.get(s_class, 0) \
+                + len(records)
+            SIGNATURES[s_class] = self.signature(cls)
+            if JOURNAL_SIZES[s_class] > self.journal_threshold:
+                self.dump(cls)
+
+    def persist(self, cls: type, record: dict, generation: int):
+        """ Write one mutation made in memory at a generation, or defer it
+        inside a batch
+        """
+        dirty = getattr(self._local, 'dirty', None)
+        if dirty is not None:
+            dirty.setdefault(cls, (generation, []))[1].append(record)
+        else:
+            self.flush(cls, [record], generation)
+
+    def flush(self, cls: type, records: List[dict], generation: int = None):
+        """ Write mutations with the configured storage mode, first
+        merging the writes other processes made since the last read, and
+        applying the mutations again in memory if a reload or replay in
+        any thread may have overwritten them since generation
+        """
+        with self.lock(cls):
+            self.refresh(cls)
+            if generation is None or generation != self.generation(cls):
+                for record in records:
+                    self.apply(cls, record)
+            if self.mode == 'journal':
+                self.append_to_journal(cls, records)
+            else:
+                self.dump(cls)
+
+    @contextmanager
+    def batch(self):
+        """ Defer persistence until the block exits, then flush each
+        modified class once; on error, reload them from storage instead
+        """
+        if getattr(self._local, 'dirty', None) is not None:
+            yield
+            return
+        self._local.dirty = {}
+        try:
+            yield
+        except BaseException:
+            dirty, self._local.dirty = self._local.dirty, None
+            for cls in dirty:
+                self.load(cls)
+            raise
+        dirty, self._local.dirty = self._local.dirty, None
+        for cls, (generation, records) in dirty.items():
+            self.flush(cls, records, generation)
+
+    def save(self, obj: TypeVar('Base')):
+        """ Store an object and persist it
+        """
+        cls = obj.__class__
+        generation = self.generation(cls)
+        objs, indexes = self.snapshot(cls)
+        objs[obj.id] = obj
+        self.index(obj, indexes)
+        self.persist(cls, {'op': 'save', 'obj': obj.to_json(True)},
+                     generation)
+
+    def remove(self, obj: TypeVar('Base')):
+        """ Drop an object and persist it
+        """
+        cls = obj.__class__
+        generation = self.generation(cls)
+        objs, indexes = self.snapshot(cls)
+        if objs.pop(obj.id, None) is not None:
+            self.unindex(cls, obj.id, indexes)
+            self.persist(cls, {'op': 'remove', 'id': obj.id}, generation)
+
+    def new_indexes(self, cls: type) -> dict:
+        """ Return empty indexes for the indexed attributes of a class
+        """
+        return {attr: Index() for attr in cls.indexed_attributes}
+
+    def unindex(self, cls: type, obj_id: str, indexes: dict = None):
+        """ Drop an object ID from the indexes
+        """
+        if indexes is None:
+            indexes = INDEXES[cls.__name__]
+        for index in indexes.values():
+            index.discard(obj_id)
+
+    def index(self, obj: TypeVar('Base'), indexes: dict = None):
+        """ Index the current values of the indexed attributes
+        """
+        if indexes is None:
+            indexes = INDEXES[obj.__class__.__name__]
+        for attr, index in indexes.items():
+            index.add(obj.id, getattr(obj, attr))
+
+    def count(self, cls: type) -> int:
+        """ Count all objects
+        """
+        return len(DATA[cls.__name__].keys())
+
+    def get(self, cls: type, id: str) -> TypeVar('Base'):
+        """ Return one object by ID
+        """
+        return DATA[cls.__name__].get(id)
+
+    def plan(self, indexes: dict, attributes: dict) -> List[str]:
+        """ Return the candidate IDs of the most selective indexed
+        condition (equality, then In, then Range/Prefix), or None to scan
+        """
+        def rank(item):
+            v = item[1]
+            return 2 if isinstance(v, Range) else 1 if isinstance(v, In) \
+                else 0
+
+        for k, v in sorted(attributes.items(), key=rank):
+            index = indexes.get(k)
+            if index is None:
+                continue
+            try:
+                if isinstance(v, In):
+                    return index.lookup_in(v.values)
+                if isinstance(v, Range):
+                    return index.lookup_range(*v.bounds())
+                if not isinstance(v, Predicate):
+                    return list(index.lookup(v))
+            except TypeError:
+                continue
+        return None
+
+    def iter_search(self, cls: type, attributes: dict, limit: int = None,
+                    offset: int = 0,
+                    after_id: str = None) -> Iterator[TypeVar('Base')]:
+        """ Lazily yield objects with matching attributes, narrowed by the
+        best indexed condition; Range and Prefix matches on an indexed
+        attribute come in value order
+        """
+        objs, indexes = self.snapshot(cls)
+        ids = self.plan(indexes, attributes)
+        if ids is None:
+            candidates = objs.scan(after_id)
+        else:
+            start = 0
+            if after_id is not None:
+                try:
+                    start = ids.index(after_id) + 1
+                except ValueError:
+                    return iter(())
+            candidates = filter(None, map(objs.get,
+                                          islice(ids, start, None)))
+
+        return paginate(candidates, attributes, limit, offset)
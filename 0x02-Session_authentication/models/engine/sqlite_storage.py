@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+""" SQLite storage module
+"""
+from contextlib import contextmanager
+from itertools import islice
+from typing import TypeVar, Iterator
+from os import getenv, getpid
+import json
+import sqlite3
+import threading
+from models.engine.storage import Storage, matcher
+from models.query import In, Predicate, Range
+
+
+SQL_TYPES = (str, int, float, bytes, type(None))
+
+
+class SQLiteStorage(Storage):
+    """ Objects persisted one row each in a sqlite3 database, with the
+    indexed attributes of each class stored in indexed columns
+    """
+
+    def __init__(self, db_path: str = None):
+        """ Open DB_SQLITE_PATH lazily, one connection per thread
+        """
+        self.db_path = db_path or getenv('DB_SQLITE_PATH', '.db.sqlite3')
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._upserts = {}
+
+    def connection(self) -> sqlite3.Connection:
+        """ Return the connection of the current thread, opened again in
+        a forked process as SQLite connections cannot cross a fork
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != getpid():
+            conn = sqlite3.connect(self.db_path)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+            self._local.pid = getpid()
+            self._local.batch = False
+        return conn
+
+    def table(self, cls: type) -> str:
+        """ Return the table of a class, created on first use
+        """
+        s_class = cls.__name__
+        if s_class in self._upserts:
+            return s_class
+        columns = ['id', 'data'] + list(cls.indexed_attributes)
+        with self._lock:
+            conn = self.connection()
+            conn.execute('CREATE TABLE IF NOT EXISTS "{}" '
+                         '(id TEXT PRIMARY KEY, data TEXT NOT NULL{})'.format(
+                             s_class, ''.join(', "{}"'.format(c)
+                                              for c in columns[2:])))
+            for column in columns[2:]:
+                conn.execute('CREATE INDEX IF NOT EXISTS "{0}_{1}" '
+                             'ON "{0}" ("{1}")'.format(s_class, column))
+            conn.commit()
+            self._upserts[s_class] = (
+                'INSERT INTO "{}" ({}) VALUES ({}) '
+                'ON CONFLICT(id) DO UPDATE SET {}'.format(
+                    s_class, ', '.join('"{}"'.format(c) for c in columns),
+                    ', '.join('?' * len(columns)),
+                    ', '.join('"{0}" = excluded."{0}"'.format(c)
+                              for c in columns[1:])))
+        return s_class
+
+    def commit(self):
+        """ Commit the current thread's writes unless inside a batch
+        """
+        if not self._local.batch:
+            self.connection().commit()
+
+    @contextmanager
+    def batch(self):
+        """ Run the writes of a block in one transaction, rolled back if
+        the block raises
+        """
+        conn = self.connection()
+        if self._local.batch:
+            yield
+            return
+        self._local.batch = True
+        try:
+            yield
+        except BaseException:
+            conn.rollback()
+            raise
+        else:
+            conn.commit()
+        finally:
+            self._local.batch = False
+
+    def load(self, cls: type):
+        """ Create the table of a class
+        """
+        self.table(cls)
+
+    def dump(self, cls: type):
+        """ Commit pending writes
+        """
+        self.table(cls)
+        self.commit()
+
+    def save(self, obj: TypeVar('Base')):
+        """ Insert or update the row of an object
+        """
+        cls = obj.__class__
+        self.table(cls)
+        values = [obj.id, json.dumps(obj.to_json(True))]
+        values += [getattr(obj, attr) for attr in cls.indexed_attributes]
+        self.connection().execute(self._upserts[cls.__name__], values)
+        self.commit()
+
+    def remove(self, obj: TypeVar('Base')):
+        """ Delete the row of an object
+        """
+        self.connection().execute('DELETE FROM "{}" WHERE id = ?'.format(
+            self.table(obj.__class__)), (obj.id,))
+        self.commit()
+
+    def count(self, cls: type) -> int:
+        """ Count the rows of a class
+        """
+        return self.connection().execute('SELECT COUNT(*) FROM "{}"'.format(
+            self.table(cls))).fetchone()[0]
+
+    def get(self, cls: type, id: str) -> TypeVar('Base'):
+        """ Return one object by ID
+        """
+        row = self.connection().execute(
+            'SELECT data FROM "{}" WHERE id = ?'.format(self.table(cls)),
+            (id,)).fetchone()
+        return None if row is None else cls(**json.loads(row[0]))
+
+    @staticmethod
+    def condition(column: str, v) -> tuple:
+        """ Translate a value or predicate on an indexed column into a
+        (SQL, parameters, exact) WHERE condition, or None if it cannot
+        be; inexact conditions are checked again in Python
+        """
+        if isinstance(v, In):
+            if None in v.values or \
+                    not all(isinstance(i, SQL_TYPES) for i in v.values):
+                return None
+            return '"{}" IN ({})'.format(
+                column, ', '.join('?' * len(v.values))), list(v.values), True
+        if isinstance(v, Range):
+            bounds = [b for b in v.bounds() if b is not None]
+            if not bounds or not all(isinstance(b, SQL_TYPES)
+                                     for b in bounds):
+                return None
+            sql, params = [], []
+            if v.start is not None:
+                sql.append('"{}" >= ?'.format(column))
+                params.append(v.start)
+            if v.end is not None:
+                sql.append('"{}" < ?'.format(column))
+                params.append(v.end)
+            return ' AND '.join(sql), params, len(bounds) == 2 \
+                and type(v.start) is type(v.end)
+        if isinstance(v, Predicate) or not isinstance(v, SQL_TYPES):
+            return None
+        return '"{}" IS ?'.format(column), [v], True
+
+    def iter_search(self, cls: type, attributes: dict, limit: int = None,
+                    offset: int = 0,
+                    after_id: str = None) -> Iterator[TypeVar('Base')]:
+        """ Lazily yield objects with matching attributes, filtering and
+        paginating in SQL on the ID and indexed attributes
+        """
+        table = self.table(cls)
+        where, params, rest = [], [], {}
+        for k, v in attributes.items():
+            condition = None
+            if k == 'id' or k in cls.indexed_attributes:
+                condition = self.condition(k, v)
+            if condition is None:
+                rest[k] = v
+                continue
+            where.append(condition[0])
+            params += condition[1]
+            if not condition[2]:
+                rest[k] = v
+        if after_id is not None:
+            where.append('rowid > (SELECT rowid FROM "{}" WHERE id = ?)'
+                         .format(table))
+            params.append(after_id)
+        query = 'SELECT data FROM "{}"'.format(table)
+        if where:
+            query += ' WHERE ' + ' AND '.join(where)
+        query += ' ORDER BY rowid'
+        if not rest and (limit is not None or offset):
+            query += ' LIMIT ? OFFSET ?'
+            params += [-1 if limit is None else limit, offset]
+            limit, offset = None, 0
+        objs = (cls(**json.loads(row[0])) for row in
+                self.connection().execute(query, params))
+        check = matcher(rest)
+        if check is not None:
+            objs = filter(check, objs)
+        return islice(objs, offset,
+                      None if limit is None else offset + limit)
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+""" Storage module
+"""
+from contextlib import contextmanager
+from itertools import islice
+from typing import Callable, TypeVar, List, Iterable, Iterator
+from models.query import Predicate
+
+
+class Storage():
+    """ Interface of the engines persisting models
+    """
+
+    def register(self, cls: type):
+        """ Prepare the storage of a class before its first instance
+        """
+
+    def load(self, cls: type):
+        """ Load the objects of a class from storage
+        """
+
+    def dump(self, cls: type):
+        """ Write the objects of a class to storage
+        """
+
+    def refresh(self, cls: type) -> bool:
+        """ Reload a class if another process changed its storage
+        """
+        return False
+
+    def save(self, obj: TypeVar('Base')):
+        """ Persist one object
+        """
+        raise NotImplementedError
+
+    def remove(self, obj: TypeVar('Base')):
+        """ Delete one object
+        """
+        raise NotImplementedError
+
+    def count(self, cls: type) -> int:
+        """ Count all objects of a class
+        """
+        raise NotImplementedError
+
+    def get(self, cls: type, id: str) -> TypeVar('Base'):
+        """ Return one object of a class by ID
+        """
+        raise NotImplementedError
+
+    def iter_search(self, cls: type, attributes: dict, limit: int = None,
+                    offset: int = 0,
+                    after_id: str = None) -> Iterator[TypeVar('Base')]:
+        """ Lazily yield the objects of a class with matching attributes,
+        starting after the object with ID after_id, skipping offset
+        matches and stopping after limit ones
+        """
+        raise NotImplementedError
+
+    def search(self, cls: type,
+               attributes: dict) -> List[TypeVar('Base')]:
+        """ Return the objects of a class with matching attributes
+        """
+        return list(self.iter_search(cls, attributes))
+
+    def all(self, cls: type) -> Iterable[TypeVar('Base')]:
+        """ Return all objects of a class
+        """
+        return self.search(cls, {})
+
+    @contextmanager
+    def batch(self):
+        """ Group the writes of a block
+        """
+        yield
+
+
+def matcher(attributes: dict) -> Callable[[TypeVar('Base')], bool]:
+    """ Compile attribute values and predicates into one check, or None
+    when every object matches
+    """
+    values = [(k, v) for k, v in attributes.items()
+              if not isinstance(v, Predicate)]
+    predicates = [(k, v.matches) for k, v in attributes.items()
+                  if isinstance(v, Predicate)]
+    if not values and not predicates:
+        return None
+    if not values and len(predicates) == 1:
+        k, match = predicates[0]
+        return lambda obj: match(getattr(obj, k))
+
+    def check(obj: TypeVar('Base')) -> bool:
+        for k, v in values:
+            if (getattr(obj, k) != v):
+                return False
+        for k, match in predicates:
+            if not match(getattr(obj, k)):
+                return False
+        return True
+    return check
+
+
+def paginate(objs: Iterable[TypeVar('Base')], attributes: dict,
+             limit: int = None, offset: int = 0,
+             after_id: str = None) -> Iterator[TypeVar('Base')]:
+    """ Filter candidate objects lazily and apply the pagination
+    """
+    objs = iter(objs)
+    if after_id is not None:
+        for obj in objs:
+            if obj.id == after_id:
+                break
+    check = matcher(attributes)
+    if check is not None:
+        objs = filter(check, objs)
+    if limit is None and not offset:
+        return objs
+    return islice(objs, offset, None if limit is None else offset + limit)
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+""" Query predicates module
+"""
+from typing import Any, Iterable, Tuple
+
+
+class Predicate():
+    """ Condition on an attribute value, usable in Base.search
+    """
+
+    def matches(self, value: Any) -> bool:
+        """ Check a value satisfies the condition
+        """
+        raise NotImplementedError
+
+
+class In(Predicate):
+    """ Value is one of several values
+    """
+
+    def __init__(self, values: Iterable):
+        """ Initialize with the accepted values
+        """
+        self.values = tuple(values)
+
+    def matches(self, value: Any) -> bool:
+        """ Check the value is accepted
+        """
+        return value in self.values
+
+
+class Range(Predicate):
+    """ Value is within [start, end), either bound being optional
+    """
+
+    def __init__(self, start: Any = None, end: Any = None):
+        """ Initialize with the inclusive start and exclusive end
+        """
+        self.start = start
+        self.end = end
+
+    def bounds(self) -> Tuple[Any, Any]:
+        """ Return the inclusive start and exclusive end
+        """
+        return self.start, self.end
+
+    def matches(self, value: Any) -> bool:
+        """ Check the value is within the bounds
+        """
+        if value is None:
+            return False
+        try:
+            return (self.start is None or self.start <= value) \
+                and (self.end is None or value < self.end)
+        except TypeError:
+            return False
+
+
+class Prefix(Range):
+    """ String value starts with a prefix
+    """
+
+    def __init__(self, prefix: str):
+        """ Initialize with the prefix
+        """
+        end = None
+        if prefix:
+            end = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        super().__init__(prefix, end)
+        self.prefix = prefix
+
+    def matches(self, value: Any) -> bool:
+        """ Check the value starts with the prefix
+        """
+        return isinstance(value, str) and value.startswith(self.prefix)